@@ -1,20 +1,27 @@
 import logging
 import math
+import os
 import select
 import threading
 
 import alsaaudio
-import gi
 import pykka
 
-gi.require_version("GstAudio", "1.0")  # noqa
-from gi.repository import GstAudio  # noqa isort:skip
-
-from mopidy import exceptions, mixer  # noqa isort:skip
+from mopidy import exceptions, mixer
 
 
 logger = logging.getLogger(__name__)
 
+_SCALE_LINEAR = 0
+_SCALE_CUBIC = 1
+_SCALE_LOG = 2
+_SCALES = {"linear": _SCALE_LINEAR, "cubic": _SCALE_CUBIC, "log": _SCALE_LOG}
+
+_MAX_DRAIN_POLLS = 100
+
+_INITIAL_BACKOFF = 1.0
+_MAX_BACKOFF = 30.0
+
 
 class AlsaMixer(pykka.ThreadingActor, mixer.Mixer):
 
@@ -53,6 +60,27 @@ class AlsaMixer(pykka.ThreadingActor, mixer.Mixer):
                 f"{', '.join(known_controls)}"
             )
 
+        if self.min_volume == self.max_volume:
+            raise exceptions.MixerError(
+                "min_volume and max_volume must differ, both are "
+                f"{self.min_volume}"
+            )
+        self._volume_range = self.max_volume - self.min_volume
+        self._scale = _SCALES[self.volume_scale]
+
+        # Both the mixer and Mopidy use integer volumes in the range 0-100,
+        # so all conversions can be computed up front.
+        self._to_volume = tuple(
+            self._compute_volume(mixer_volume) for mixer_volume in range(101)
+        )
+        self._to_mixer_volume = tuple(
+            self._compute_mixer_volume(volume) for volume in range(101)
+        )
+
+        self._observer = None
+        self._mixer_handle = None
+        self._last_raw_volume = None
+        self._last_raw_mute = None
         self._last_volume = None
         self._last_mute = None
 
@@ -62,90 +90,137 @@ class AlsaMixer(pykka.ThreadingActor, mixer.Mixer):
         )
 
     def on_start(self):
+        # The observer never needs a result, so use defer() to send a plain
+        # message instead of creating a future for every notification.
+        proxy = self.actor_ref.proxy()
         self._observer = AlsaMixerObserver(
             device=self.device,
             control=self.control,
-            callback=self.actor_ref.proxy().trigger_events_for_changed_values,
+            callback=proxy.trigger_events_for_changed_values.defer,
         )
         self._observer.start()
 
+    def on_stop(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+        self._close_mixer()
+
     @property
     def _mixer(self):
-        # The mixer must be recreated every time it is used to be able to
-        # observe volume/mute changes done by other applications.
-        return alsaaudio.Mixer(
-            device=self.device,
-            control=self.control,
-        )
+        # The mixer is kept open for the lifetime of the actor. Changes done
+        # by other applications are picked up by _refresh_mixer().
+        if self._mixer_handle is None:
+            self._mixer_handle = alsaaudio.Mixer(
+                device=self.device,
+                control=self.control,
+            )
+        return self._mixer_handle
+
+    def _close_mixer(self):
+        if self._mixer_handle is not None:
+            self._mixer_handle.close()
+            self._mixer_handle = None
+
+    def _refresh_mixer(self):
+        # Let libasound process pending events so that the cached element
+        # state reflects volume/mute changes done by other applications.
+        try:
+            self._mixer.handleevents()
+        except alsaaudio.ALSAAudioError as exc:
+            logger.debug(f"Reopening ALSA mixer after error: {exc}")
+            self._close_mixer()
+        return self._mixer
 
     def get_volume(self):
-        channels = self._mixer.getvolume()
+        try:
+            channels = self._refresh_mixer().getvolume()
+        except alsaaudio.ALSAAudioError as exc:
+            # Reopen the mixer on the next call, e.g. if the device is back.
+            logger.debug(f"Getting volume failed: {exc}")
+            self._close_mixer()
+            return None
+        return self._volume_from_channels(channels)
+
+    def _volume_from_channels(self, channels):
         if not channels:
             return None
-        elif channels.count(channels[0]) == len(channels):
-            return self.mixer_volume_to_volume(channels[0])
+        first = channels[0]
+        if all(channel == first for channel in channels):
+            return self.mixer_volume_to_volume(first)
         else:
             # Not all channels have the same volume
             return None
 
     def set_volume(self, volume):
-        self._mixer.setvolume(self.volume_to_mixer_volume(volume))
-        return True
+        try:
+            self._mixer.setvolume(self.volume_to_mixer_volume(volume))
+            return True
+        except alsaaudio.ALSAAudioError as exc:
+            logger.debug(f"Setting volume failed: {exc}")
+            self._close_mixer()
+            return False
 
     def mixer_volume_to_volume(self, mixer_volume):
+        return self._to_volume[max(0, min(100, mixer_volume))]
+
+    def volume_to_mixer_volume(self, volume):
+        return self._to_mixer_volume[max(0, min(100, volume))]
+
+    def _compute_volume(self, mixer_volume):
         volume = mixer_volume
-        if self.volume_scale == "cubic":
-            volume = (
-                GstAudio.StreamVolume.convert_volume(
-                    GstAudio.StreamVolumeFormat.CUBIC,
-                    GstAudio.StreamVolumeFormat.LINEAR,
-                    volume / 100.0,
-                )
-                * 100.0
-            )
-        elif self.volume_scale == "log":
+        scale = self._scale
+        if scale == _SCALE_CUBIC:
+            # Same as GstAudio.StreamVolume.convert_volume() from
+            # GstAudio.StreamVolumeFormat.CUBIC to LINEAR.
+            volume /= 100.0
+            volume = volume * volume * volume * 100.0
+        elif scale == _SCALE_LOG:
             # Uses our own formula rather than GstAudio.StreamVolume.
             # convert_volume(GstAudio.StreamVolumeFormat.LINEAR,
             # GstAudio.StreamVolumeFormat.DB, mixer_volume / 100.0)
             # as the result is a DB value, which we can't work with as
             # self._mixer provides a percentage.
             volume = math.pow(10, volume / 50.0)
-        volume = (
-            (volume - self.min_volume)
-            * 100.0
-            / (self.max_volume - self.min_volume)
-        )
-        return int(volume)
-
-    def volume_to_mixer_volume(self, volume):
-        mixer_volume = (
-            self.min_volume
-            + volume * (self.max_volume - self.min_volume) / 100.0
-        )
-        if self.volume_scale == "cubic":
-            mixer_volume = (
-                GstAudio.StreamVolume.convert_volume(
-                    GstAudio.StreamVolumeFormat.LINEAR,
-                    GstAudio.StreamVolumeFormat.CUBIC,
-                    mixer_volume / 100.0,
-                )
-                * 100.0
-            )
-        elif self.volume_scale == "log":
+        return int((volume - self.min_volume) * 100.0 / self._volume_range)
+
+    def _compute_mixer_volume(self, volume):
+        mixer_volume = self.min_volume + volume * self._volume_range / 100.0
+        scale = self._scale
+        if scale == _SCALE_CUBIC:
+            # Same as GstAudio.StreamVolume.convert_volume() from
+            # GstAudio.StreamVolumeFormat.LINEAR to CUBIC.
+            mixer_volume = math.pow(mixer_volume / 100.0, 1 / 3.0) * 100.0
+        elif scale == _SCALE_LOG:
             # Uses our own formula rather than GstAudio.StreamVolume.
             # convert_volume(GstAudio.StreamVolumeFormat.LINEAR,
             # GstAudio.StreamVolumeFormat.DB, mixer_volume / 100.0)
             # as the result is a DB value, which we can't work with as
-            # self._mixer wants a percentage.
-            mixer_volume = 50 * math.log10(mixer_volume)
+            # self._mixer wants a percentage. Silence has no logarithm, so
+            # it maps to the lowest mixer volume.
+            if mixer_volume > 0:
+                mixer_volume = 50 * math.log10(mixer_volume)
         return int(mixer_volume)
 
     def get_mute(self):
         try:
-            channels_muted = self._mixer.getmute()
+            mixer = self._refresh_mixer()
         except alsaaudio.ALSAAudioError as exc:
             logger.debug(f"Getting mute state failed: {exc}")
             return None
+        return self._mute_from_channels(self._get_mute_channels(mixer))
+
+    def _get_mute_channels(self, mixer):
+        try:
+            return mixer.getmute()
+        except alsaaudio.ALSAAudioError as exc:
+            logger.debug(f"Getting mute state failed: {exc}")
+            self._close_mixer()
+            return None
+
+    def _mute_from_channels(self, channels_muted):
+        if channels_muted is None:
+            return None
         if all(channels_muted):
             return True
         elif not any(channels_muted):
@@ -160,11 +235,41 @@ class AlsaMixer(pykka.ThreadingActor, mixer.Mixer):
             return True
         except alsaaudio.ALSAAudioError as exc:
             logger.debug(f"Setting mute state failed: {exc}")
+            self._close_mixer()
             return False
 
+    def _get_raw_volume_and_mute(self):
+        # Refresh the mixer once for both reads.
+        mixer = self._refresh_mixer()
+        channels = tuple(mixer.getvolume())
+        # Read mute last, as failing to do so closes the mixer.
+        channels_muted = self._get_mute_channels(mixer)
+        return (
+            channels,
+            tuple(channels_muted) if channels_muted is not None else None,
+        )
+
     def trigger_events_for_changed_values(self):
-        old_volume, self._last_volume = self._last_volume, self.get_volume()
-        old_mute, self._last_mute = self._last_mute, self.get_mute()
+        try:
+            raw_volume, raw_mute = self._get_raw_volume_and_mute()
+        except alsaaudio.ALSAAudioError as exc:
+            # The observer calls this with defer(), where an exception would
+            # stop the actor.
+            logger.debug(f"Reading mixer state failed: {exc}")
+            self._close_mixer()
+            return
+        if (
+            raw_volume == self._last_raw_volume
+            and raw_mute == self._last_raw_mute
+        ):
+            # The event was for something else than our control's playback
+            # volume or mute state.
+            return
+        self._last_raw_volume, self._last_raw_mute = raw_volume, raw_mute
+
+        old_volume, old_mute = self._last_volume, self._last_mute
+        self._last_volume = self._volume_from_channels(raw_volume)
+        self._last_mute = self._mute_from_channels(raw_mute)
 
         if old_volume != self._last_volume:
             self.trigger_volume_changed(self._last_volume)
@@ -191,18 +296,91 @@ class AlsaMixerObserver(threading.Thread):
 
         self.callback = callback
 
+        # Written to by stop() to wake up the observer, so that it can block
+        # in poll() without a timeout. The pipe is never read, so it must be
+        # edge-triggered to only be reported once.
+        self._wake_fd, self._wake_write_fd = os.pipe()
+        self._wake_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+        self._poll = select.epoll()
+        self._poll.register(self._wake_fd, select.EPOLLIN | select.EPOLLET)
+        self._poll.register(self.fd, self.event_mask | select.EPOLLET)
+        self._backoff = _INITIAL_BACKOFF
+
     def stop(self):
-        self.running = False
+        # The lock keeps run() from closing the pipe while we write to it.
+        with self._wake_lock:
+            if self.running:
+                self.running = False
+                self._stopped.set()
+                os.write(self._wake_write_fd, b"\x00")
 
     def run(self):
-        poller = select.epoll()
-        poller.register(self.fd, self.event_mask | select.EPOLLET)
-        while self.running:
-            try:
-                events = poller.poll(timeout=1)
-                if events and self.callback is not None:
-                    self.callback()
-            except OSError as exc:
-                # poller.poll() will raise an IOError because of the
-                # interrupted system call when suspending the machine.
-                logger.debug(f"Ignored IO error: {exc}")
+        try:
+            while self.running:
+                self._listen()
+        finally:
+            with self._wake_lock:
+                self.running = False
+                os.close(self._wake_fd)
+                os.close(self._wake_write_fd)
+            self._poll.close()
+            self.mixer.close()
+
+    def _listen(self):
+        try:
+            events = pending = self._poll.poll()
+            # A single change, e.g. dragging a volume slider, can produce a
+            # burst of events. Collect them before notifying the mixer, for
+            # as long as the mixer descriptor keeps reporting.
+            for _ in range(_MAX_DRAIN_POLLS):
+                if not self.running:
+                    break
+                if not any(fd == self.fd for fd, _event in pending):
+                    break
+                pending = self._poll.poll(timeout=0)
+                events = events + pending
+        except OSError as exc:
+            # poll() will raise an IOError because of the interrupted
+            # system call when suspending the machine. Back off so that a
+            # persistent error doesn't make us spin.
+            logger.debug(
+                f"Ignored IO error, retrying in {self._backoff:.0f}s: {exc}"
+            )
+            self._stopped.wait(self._backoff)
+            self._backoff = min(self._backoff * 2, _MAX_BACKOFF)
+            return
+
+        if not self.running:
+            return
+
+        mixer_events = [event for fd, event in events if fd == self.fd]
+        if not mixer_events:
+            return
+        self._backoff = _INITIAL_BACKOFF
+
+        error_mask = select.EPOLLHUP | select.EPOLLERR
+        if any(event & error_mask for event in mixer_events):
+            # The descriptor is dead, e.g. because the card was unplugged,
+            # and would keep reporting the error. Stop observing it, and let
+            # the mixer find out about the new state one last time.
+            logger.warning(
+                "ALSA mixer stopped reporting events. "
+                "Changes done by other applications will not be noticed."
+            )
+            self._poll.unregister(self.fd)
+            with self._wake_lock:
+                self.running = False
+            if self.callback is not None:
+                self.callback()
+            return
+
+        # Acknowledge the events so that libasound's queue is drained.
+        try:
+            self.mixer.handleevents()
+        except alsaaudio.ALSAAudioError as exc:
+            logger.debug(f"Handling mixer events failed: {exc}")
+
+        if self.callback is not None:
+            self.callback()
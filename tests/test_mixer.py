@@ -1,11 +1,15 @@
 import copy
+import os
+import select
+import threading
+import time
 import unittest
 from unittest import mock
 
 import alsaaudio
 
 from mopidy import exceptions
-from mopidy_alsamixer.mixer import AlsaMixer
+from mopidy_alsamixer.mixer import AlsaMixer, AlsaMixerObserver
 
 
 @mock.patch(
@@ -51,6 +55,7 @@ class MixerTest(unittest.TestCase):
 
     def test_use_default_device_from_config(self, alsa_mock):
         alsa_mock.cards.return_value = ["PCH", "SB"]
+        alsa_mock.Mixer.return_value.getvolume.return_value = [50]
         alsa_mock.mixers.return_value = ["Master"]
         config = {"alsamixer": {"control": "Master"}}
 
@@ -64,6 +69,7 @@ class MixerTest(unittest.TestCase):
 
     def test_use_device_from_config(self, alsa_mock):
         alsa_mock.cards.return_value = ["PCH", "SB"]
+        alsa_mock.Mixer.return_value.getvolume.return_value = [50]
         alsa_mock.mixers.return_value = ["Master"]
         config = {
             "alsamixer": {
@@ -94,6 +100,7 @@ class MixerTest(unittest.TestCase):
 
     def test_use_card_from_config(self, alsa_mock):
         alsa_mock.cards.return_value = ["PCH", "SB"]
+        alsa_mock.Mixer.return_value.getvolume.return_value = [50]
         alsa_mock.mixers.return_value = ["Master"]
         config = {"alsamixer": {"card": 1, "control": "Master"}}
 
@@ -104,6 +111,7 @@ class MixerTest(unittest.TestCase):
 
     def test_use_card_with_index_not_in_cards_list(self, alsa_mock):
         alsa_mock.cards.return_value = ["PCH", "SB"]
+        alsa_mock.Mixer.return_value.getvolume.return_value = [50]
         alsa_mock.mixers.return_value = ["Master"]
         config = {"alsamixer": {"card": 2, "control": "Master"}}
 
@@ -130,6 +138,7 @@ class MixerTest(unittest.TestCase):
 
     def test_use_control_from_config(self, alsa_mock):
         alsa_mock.cards.return_value = ["PCH", "SB"]
+        alsa_mock.Mixer.return_value.getvolume.return_value = [50]
         alsa_mock.mixers.return_value = ["Speaker"]
         config = {"alsamixer": {"device": "PCH", "control": "Speaker"}}
         mixer = self.get_mixer(config=config)
@@ -138,6 +147,102 @@ class MixerTest(unittest.TestCase):
 
         alsa_mock.Mixer.assert_called_once_with(device="PCH", control="Speaker")
 
+    def test_reuses_mixer_between_calls(self, alsa_mock):
+        mixer = self.get_mixer(alsa_mock)
+        mixer_mock = alsa_mock.Mixer.return_value
+        mixer_mock.getvolume.return_value = [86]
+        mixer_mock.getmute.return_value = [0]
+
+        mixer.get_volume()
+        mixer.set_volume(50)
+        mixer.get_mute()
+        mixer.set_mute(True)
+
+        alsa_mock.Mixer.assert_called_once_with(
+            device="default", control="Master"
+        )
+        self.assertEqual(mixer_mock.handleevents.call_count, 2)
+
+    def test_reopens_mixer_if_handling_events_fails(self, alsa_mock):
+        mixer = self.get_mixer(alsa_mock)
+        mixer_mock = alsa_mock.Mixer.return_value
+        mixer_mock.getvolume.return_value = [86]
+        mixer.get_volume()
+        mixer_mock.handleevents.side_effect = alsa_mock.ALSAAudioError
+
+        mixer.get_volume()
+
+        mixer_mock.close.assert_called_once_with()
+        self.assertEqual(alsa_mock.Mixer.call_count, 2)
+
+    def test_get_volume_reopens_mixer_after_error(self, alsa_mock):
+        mixer = self.get_mixer(alsa_mock)
+        mixer_mock = alsa_mock.Mixer.return_value
+        mixer_mock.getvolume.side_effect = alsa_mock.ALSAAudioError
+
+        self.assertIsNone(mixer.get_volume())
+
+        mixer_mock.close.assert_called_once_with()
+        mixer_mock.getvolume.side_effect = None
+        mixer_mock.getvolume.return_value = [86]
+        self.assertEqual(mixer.get_volume(), 63)
+        self.assertEqual(alsa_mock.Mixer.call_count, 2)
+
+    def test_set_volume_reopens_mixer_after_error(self, alsa_mock):
+        config = {"alsamixer": {"volume_scale": "linear"}}
+        mixer = self.get_mixer(alsa_mock, config=config)
+        mixer_mock = alsa_mock.Mixer.return_value
+        mixer_mock.setvolume.side_effect = alsa_mock.ALSAAudioError
+
+        self.assertFalse(mixer.set_volume(74))
+
+        mixer_mock.close.assert_called_once_with()
+        mixer_mock.setvolume.side_effect = None
+        self.assertTrue(mixer.set_volume(74))
+        self.assertEqual(alsa_mock.Mixer.call_count, 2)
+
+    def test_set_mute_reopens_mixer_after_error(self, alsa_mock):
+        mixer = self.get_mixer(alsa_mock)
+        mixer_mock = alsa_mock.Mixer.return_value
+        mixer_mock.setmute.side_effect = alsa_mock.ALSAAudioError
+
+        self.assertFalse(mixer.set_mute(True))
+
+        mixer_mock.close.assert_called_once_with()
+        mixer_mock.setmute.side_effect = None
+        self.assertTrue(mixer.set_mute(True))
+        self.assertEqual(alsa_mock.Mixer.call_count, 2)
+
+    def test_get_mute_when_reopening_mixer_fails(self, alsa_mock):
+        mixer = self.get_mixer(alsa_mock)
+        mixer_mock = alsa_mock.Mixer.return_value
+        mixer_mock.getmute.return_value = [0]
+        mixer.get_mute()
+        mixer_mock.handleevents.side_effect = alsa_mock.ALSAAudioError
+        alsa_mock.Mixer.side_effect = alsa_mock.ALSAAudioError
+
+        self.assertIsNone(mixer.get_mute())
+        self.assertIsNone(mixer.get_volume())
+
+    def test_on_stop_closes_mixer(self, alsa_mock):
+        mixer = self.get_mixer(alsa_mock)
+        mixer_mock = alsa_mock.Mixer.return_value
+        mixer_mock.getvolume.return_value = [86]
+        mixer.get_volume()
+
+        mixer.on_stop()
+
+        mixer_mock.close.assert_called_once_with()
+
+    def test_on_stop_stops_observer(self, alsa_mock):
+        mixer = self.get_mixer(alsa_mock)
+        observer_mock = mock.Mock()
+        mixer._observer = observer_mock
+
+        mixer.on_stop()
+
+        observer_mock.stop.assert_called_once_with()
+
     def test_fails_if_control_is_unknown(self, alsa_mock):
         alsa_mock.cards.return_value = ["PCH", "SB"]
         alsa_mock.mixers.return_value = ["Headphone", "Master"]
@@ -149,6 +254,27 @@ class MixerTest(unittest.TestCase):
         self.assertIn("Could not find ALSA mixer control", str(ex.exception))
         self.assertIn("include: Headphone, Master", str(ex.exception))
 
+    def test_fails_if_min_volume_equals_max_volume(self, alsa_mock):
+        config = {"alsamixer": {"min_volume": 60, "max_volume": 60}}
+
+        with self.assertRaises(exceptions.MixerError) as ex:
+            self.get_mixer(alsa_mock, config=config)
+
+        self.assertIn("must differ", str(ex.exception))
+
+    def test_inverted_volume_range(self, alsa_mock):
+        config = {
+            "alsamixer": {
+                "min_volume": 100,
+                "max_volume": 0,
+                "volume_scale": "linear",
+            }
+        }
+        mixer = self.get_mixer(alsa_mock, config=config)
+
+        self.assertEqual(mixer.volume_to_mixer_volume(30), 70)
+        self.assertEqual(mixer.mixer_volume_to_volume(70), 30)
+
     def test_get_volume(self, alsa_mock):
         config = {"alsamixer": {"volume_scale": "linear"}}
         mixer = self.get_mixer(alsa_mock, config=config)
@@ -224,6 +350,22 @@ class MixerTest(unittest.TestCase):
 
         mixer_mock.setvolume.assert_called_once_with(93)
 
+    def test_set_volume_log_to_zero(self, alsa_mock):
+        config = {"alsamixer": {"volume_scale": "log"}}
+        mixer = self.get_mixer(alsa_mock, config=config)
+        mixer_mock = alsa_mock.Mixer.return_value
+
+        self.assertTrue(mixer.set_volume(0))
+
+        mixer_mock.setvolume.assert_called_once_with(0)
+
+    def test_volume_conversion_clamps_out_of_range_values(self, alsa_mock):
+        config = {"alsamixer": {"volume_scale": "linear"}}
+        mixer = self.get_mixer(alsa_mock, config=config)
+
+        self.assertEqual(mixer.mixer_volume_to_volume(120), 100)
+        self.assertEqual(mixer.volume_to_mixer_volume(-5), 0)
+
     def test_get_mute_when_muted(self, alsa_mock):
         mixer = self.get_mixer(alsa_mock)
         mixer_mock = alsa_mock.Mixer.return_value
@@ -316,7 +458,293 @@ class MixerTest(unittest.TestCase):
 
         mixer.trigger_events_for_changed_values()
 
+        mixer_mock.handleevents.assert_called_once_with()
         mixer_mock.getvolume.assert_called_once_with()
         mixer_mock.getmute.assert_called_once_with()
         mixer.trigger_volume_changed.assert_called_once_with(75)
         mixer.trigger_mute_changed.assert_called_once_with(True)
+
+    def test_trigger_events_for_changed_values_after_unchanged_event(
+        self, alsa_mock
+    ):
+        mixer_mock = alsa_mock.Mixer.return_value
+        mixer_mock.getvolume.return_value = [75]
+        mixer_mock.getmute.return_value = [0]
+        config = {"alsamixer": {"volume_scale": "linear"}}
+        mixer = self.get_mixer(alsa_mock, config=config)
+        mixer.trigger_volume_changed = mock.Mock()
+        mixer.trigger_mute_changed = mock.Mock()
+        mixer.trigger_events_for_changed_values()
+
+        with mock.patch.object(
+            mixer, "_volume_from_channels"
+        ) as volume_mock, mock.patch.object(
+            mixer, "_mute_from_channels"
+        ) as mute_mock:
+            mixer.trigger_events_for_changed_values()
+
+        self.assertEqual(volume_mock.call_count, 0)
+        self.assertEqual(mute_mock.call_count, 0)
+        mixer.trigger_volume_changed.reset_mock()
+
+        mixer_mock.getvolume.return_value = [60]
+        mixer.trigger_events_for_changed_values()
+
+        mixer.trigger_volume_changed.assert_called_once_with(60)
+        mixer.trigger_mute_changed.assert_called_once_with(False)
+
+    def test_trigger_events_for_changed_values_when_read_fails(self, alsa_mock):
+        mixer_mock = alsa_mock.Mixer.return_value
+        mixer_mock.getvolume.side_effect = alsa_mock.ALSAAudioError
+        mixer = self.get_mixer(alsa_mock)
+        mixer.trigger_volume_changed = mock.Mock()
+
+        mixer.trigger_events_for_changed_values()
+
+        mixer_mock.close.assert_called_once_with()
+        self.assertEqual(mixer.trigger_volume_changed.call_count, 0)
+
+    def test_actor_survives_failing_deferred_read(self, alsa_mock):
+        # A pipe stands in for the observer's poll descriptor.
+        read_fd, write_fd = os.pipe()
+        self.addCleanup(os.close, read_fd)
+        self.addCleanup(os.close, write_fd)
+        mixer_mock = alsa_mock.Mixer.return_value
+        mixer_mock.polldescriptors.return_value = [(read_fd, select.EPOLLIN)]
+        mixer_mock.getvolume.side_effect = alsa_mock.ALSAAudioError
+        alsa_mock.cards.return_value = ["PCH"]
+        alsa_mock.mixers.return_value = ["Master"]
+        config = copy.deepcopy(MixerTest.default_config)
+        actor_ref = AlsaMixer.start(config=config)
+        self.addCleanup(actor_ref.stop)
+        proxy = actor_ref.proxy()
+
+        proxy.trigger_events_for_changed_values.defer()
+        proxy.get_mute().get(timeout=2)
+
+        self.assertTrue(actor_ref.is_alive())
+
+
+@mock.patch("mopidy_alsamixer.mixer.os")
+@mock.patch("mopidy_alsamixer.mixer.select.epoll")
+@mock.patch(
+    "mopidy_alsamixer.mixer.alsaaudio",
+    spec=alsaaudio,
+    ALSAAudioError=alsaaudio.ALSAAudioError,
+)
+class MixerObserverTest(unittest.TestCase):
+    def get_observer(self, alsa_mock, os_mock, callback=None):
+        mixer_mock = alsa_mock.Mixer.return_value
+        mixer_mock.polldescriptors.return_value = [(7, select.EPOLLIN)]
+        os_mock.pipe.return_value = (20, 21)
+        return AlsaMixerObserver(
+            device="default", control="Master", callback=callback
+        )
+
+    def test_registers_descriptors_once(self, alsa_mock, epoll_mock, os_mock):
+        poll_mock = epoll_mock.return_value
+        poll_mock.poll.return_value = []
+        observer = self.get_observer(alsa_mock, os_mock)
+
+        observer._listen()
+        observer._listen()
+
+        epoll_mock.assert_called_once_with()
+        self.assertEqual(
+            poll_mock.register.call_args_list,
+            [
+                mock.call(20, select.EPOLLIN | select.EPOLLET),
+                mock.call(7, select.EPOLLIN | select.EPOLLET),
+            ],
+        )
+
+    def test_polls_without_timeout(self, alsa_mock, epoll_mock, os_mock):
+        poll_mock = epoll_mock.return_value
+        poll_mock.poll.return_value = []
+        observer = self.get_observer(alsa_mock, os_mock)
+
+        observer._listen()
+
+        poll_mock.poll.assert_called_once_with()
+
+    def test_stops_polling_descriptor_on_hangup(
+        self, alsa_mock, epoll_mock, os_mock
+    ):
+        poll_mock = epoll_mock.return_value
+        poll_mock.poll.side_effect = [[(7, select.EPOLLHUP)], []]
+        callback = mock.Mock()
+        observer = self.get_observer(alsa_mock, os_mock, callback=callback)
+
+        observer.run()
+
+        poll_mock.unregister.assert_called_once_with(7)
+        self.assertEqual(poll_mock.register.call_count, 2)
+        self.assertFalse(observer.running)
+        callback.assert_called_once_with()
+
+    def test_calls_callback_on_events(self, alsa_mock, epoll_mock, os_mock):
+        poll_mock = epoll_mock.return_value
+        poll_mock.poll.side_effect = [[(7, select.EPOLLIN)], []]
+        callback = mock.Mock()
+        observer = self.get_observer(alsa_mock, os_mock, callback=callback)
+
+        observer._listen()
+
+        callback.assert_called_once_with()
+
+    def test_coalesces_burst_of_events(self, alsa_mock, epoll_mock, os_mock):
+        poll_mock = epoll_mock.return_value
+        poll_mock.poll.side_effect = [
+            [(7, select.EPOLLIN)],
+            [(7, select.EPOLLIN)],
+            [(7, select.EPOLLIN)],
+            [],
+        ]
+        callback = mock.Mock()
+        observer = self.get_observer(alsa_mock, os_mock, callback=callback)
+
+        observer._listen()
+
+        self.assertEqual(poll_mock.poll.call_count, 4)
+        alsa_mock.Mixer.return_value.handleevents.assert_called_once_with()
+        callback.assert_called_once_with()
+
+    def test_stops_draining_when_mixer_is_quiet(
+        self, alsa_mock, epoll_mock, os_mock
+    ):
+        poll_mock = epoll_mock.return_value
+        poll_mock.poll.side_effect = [
+            [(7, select.EPOLLIN)],
+            [(20, select.EPOLLIN)],
+            [(20, select.EPOLLIN)],
+        ]
+        callback = mock.Mock()
+        observer = self.get_observer(alsa_mock, os_mock, callback=callback)
+
+        observer._listen()
+
+        self.assertEqual(poll_mock.poll.call_count, 2)
+        callback.assert_called_once_with()
+
+    def test_draining_is_bounded(self, alsa_mock, epoll_mock, os_mock):
+        poll_mock = epoll_mock.return_value
+        poll_mock.poll.return_value = [(7, select.EPOLLIN)]
+        callback = mock.Mock()
+        observer = self.get_observer(alsa_mock, os_mock, callback=callback)
+
+        observer._listen()
+
+        self.assertEqual(poll_mock.poll.call_count, 101)
+        callback.assert_called_once_with()
+
+    def test_stop_wakes_up_observer(self, alsa_mock, epoll_mock, os_mock):
+        poll_mock = epoll_mock.return_value
+        callback = mock.Mock()
+        observer = self.get_observer(alsa_mock, os_mock, callback=callback)
+
+        observer.stop()
+
+        os_mock.write.assert_called_once_with(21, b"\x00")
+
+        poll_mock.poll.side_effect = [[(20, select.EPOLLIN)], []]
+        observer._listen()
+
+        self.assertEqual(callback.call_count, 0)
+
+    def test_closes_resources_when_stopped(
+        self, alsa_mock, epoll_mock, os_mock
+    ):
+        observer = self.get_observer(alsa_mock, os_mock)
+        observer.stop()
+
+        observer.run()
+
+        epoll_mock.return_value.close.assert_called_once_with()
+        alsa_mock.Mixer.return_value.close.assert_called_once_with()
+        self.assertEqual(
+            os_mock.close.call_args_list, [mock.call(20), mock.call(21)]
+        )
+
+    def test_backs_off_on_poll_errors(self, alsa_mock, epoll_mock, os_mock):
+        poll_mock = epoll_mock.return_value
+        poll_mock.poll.side_effect = [OSError] * 7 + [
+            [(7, select.EPOLLIN)],
+            [],
+            OSError,
+        ]
+        observer = self.get_observer(alsa_mock, os_mock)
+        observer._stopped = mock.Mock()
+
+        for _ in range(9):
+            observer._listen()
+
+        self.assertEqual(
+            observer._stopped.wait.call_args_list,
+            [mock.call(d) for d in (1.0, 2.0, 4.0, 8.0, 16.0, 30.0, 30.0, 1.0)],
+        )
+
+    def test_stop_interrupts_backoff(self, alsa_mock, epoll_mock, os_mock):
+        epoll_mock.return_value.poll.side_effect = OSError
+        observer = self.get_observer(alsa_mock, os_mock)
+        observer._backoff = 30.0
+        timer = threading.Timer(0.1, observer.stop)
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+        start = time.monotonic()
+        observer._listen()
+
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertFalse(observer.running)
+
+
+@mock.patch(
+    "mopidy_alsamixer.mixer.alsaaudio",
+    spec=alsaaudio,
+    ALSAAudioError=alsaaudio.ALSAAudioError,
+)
+class MixerObserverThreadTest(unittest.TestCase):
+    def test_stop_ends_thread(self, alsa_mock):
+        # A pipe stands in for the mixer's poll descriptor.
+        read_fd, write_fd = os.pipe()
+        self.addCleanup(os.close, read_fd)
+        self.addCleanup(os.close, write_fd)
+        mixer_mock = alsa_mock.Mixer.return_value
+        mixer_mock.polldescriptors.return_value = [(read_fd, select.EPOLLIN)]
+        callback = mock.Mock()
+        observer = AlsaMixerObserver(
+            device="default", control="Master", callback=callback
+        )
+        observer.start()
+
+        os.write(write_fd, b"\x00")
+        for _ in range(100):
+            if callback.called:
+                break
+            time.sleep(0.01)
+        observer.stop()
+        observer.join(2)
+
+        self.assertFalse(observer.is_alive())
+        callback.assert_called_once_with()
+        mixer_mock.close.assert_called_once_with()
+
+    def test_hangup_ends_thread(self, alsa_mock):
+        # A pipe stands in for the mixer's poll descriptor. Closing its
+        # write end makes the read end report EPOLLHUP for good.
+        read_fd, write_fd = os.pipe()
+        self.addCleanup(os.close, read_fd)
+        mixer_mock = alsa_mock.Mixer.return_value
+        mixer_mock.polldescriptors.return_value = [(read_fd, select.EPOLLIN)]
+        callback = mock.Mock()
+        observer = AlsaMixerObserver(
+            device="default", control="Master", callback=callback
+        )
+        observer.start()
+
+        os.close(write_fd)
+        observer.join(2)
+        time.sleep(0.1)
+
+        self.assertFalse(observer.is_alive())
+        callback.assert_called_once_with()